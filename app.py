@@ -3,49 +3,127 @@
 
 import streamlit as st
 import pandas as pd
-import os
+import logging
 import requests
-import json
-import tempfile
+import orjson
 from dotenv import load_dotenv
+from cache import AUDIO_MIME_TYPES, AUDIO_SUFFIXES, TTS_FORMAT, tts_key, gpt_key, get_cached_audio, store_audio, get_cached_reply, store_reply
+from openai_client import create_openai_session, fetch_batch_answers
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken is optional; history length is estimated from characters without it
+    tiktoken = None
 
 # Load environment variables
 load_dotenv()
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+
+# Log INFO and above by default; set the service loggers to DEBUG to see request details
+logging.basicConfig(level=logging.INFO)
+
+@st.cache_resource(show_spinner=False)
+def get_openai_session():
+    """Create the OpenAI session once per process so TTS and chat calls reuse keep-alive connections across reruns"""
+    return create_openai_session(pool_maxsize=20)
+
+# This script's module body re-runs on every interaction, so the shared session is looked up here
+_OPENAI_SESSION = get_openai_session()
+
+# Chat model; gpt-4o-mini automatically reuses cached prompt prefixes across requests
+GPT_MODEL = "gpt-4o-mini"
+# Maximum number of tokens of conversation history sent with each request
+HISTORY_TOKEN_BUDGET = 1000
+_SYSTEM_MSG = {"role": "system", "content": "You are a helpful assistant for elderly healthcare guidance."}
+
+try:
+    _ENCODING = tiktoken.encoding_for_model(GPT_MODEL) if tiktoken else None
+except Exception:
+    _ENCODING = None
 
 # TTS function
 def text_to_speech(text):
-    headers = {
-        "Authorization": f"Bearer {OPENAI_API_KEY}",
-        "Content-Type": "application/json"
-    }
     payload = {
         "model": "tts-1",
         "input": text[:4096],
         "voice": "nova",
-        "response_format": "mp3"
+        "response_format": TTS_FORMAT
     }
-    response = requests.post("https://api.openai.com/v1/audio/speech", headers=headers, json=payload)
-    if response.status_code == 200:
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".mp3")
-        temp_file.write(response.content)
-        temp_file.close()
-        return temp_file.name
+    # TTS output is deterministic for a given text/voice, so serve repeats (and batch pre-rendered clips) from disk
+    key = tts_key(payload["input"], payload["model"], payload["voice"], payload["response_format"])
+    suffix = AUDIO_SUFFIXES[TTS_FORMAT]
+    cached_file = get_cached_audio(key, suffix=suffix)
+    if cached_file:
+        return cached_file
+    with _OPENAI_SESSION.post("https://api.openai.com/v1/audio/speech", data=orjson.dumps(payload), stream=True) as response:
+        if response.status_code == 200:
+            # Write the audio to disk as it arrives instead of buffering the whole body in memory
+            return store_audio(key, response.iter_content(chunk_size=16384), suffix=suffix)
     return None
 
 # GPT function
 def get_gpt_response(user_input, history=[]):
-    headers = {
-        "Authorization": f"Bearer {OPENAI_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    messages = [{"role": "system", "content": "You are a helpful assistant for elderly healthcare guidance."}]
-    messages += history[-5:] + [{"role": "user", "content": user_input}]
-    payload = {"model": "gpt-3.5-turbo", "messages": messages}
-    response = requests.post("https://api.openai.com/v1/chat/completions", headers=headers, json=payload)
-    if response.status_code == 200:
-        return response.json()['choices'][0]['message']['content']
-    return "I'm sorry, something went wrong."
+    try:
+        return _fetch_gpt_reply(user_input, history)
+    except requests.RequestException:
+        return "I'm sorry, something went wrong."
+
+@st.cache_data(ttl=600, show_spinner=False)
+def _fetch_gpt_reply(user_input, history):
+    """Request a chat reply, memoized per (input, history) for the Streamlit process.
+    
+    Failures raise instead of returning so they are never cached.
+    """
+    messages = [_SYSTEM_MSG] + _trim_history(history, HISTORY_TOKEN_BUDGET) + [{"role": "user", "content": user_input}]
+    payload = {"model": GPT_MODEL, "messages": messages}
+    key = gpt_key(payload)
+    cached_reply = get_cached_reply(key)
+    if cached_reply is not None:
+        return cached_reply
+    response = _OPENAI_SESSION.post("https://api.openai.com/v1/chat/completions", data=orjson.dumps(payload))
+    response.raise_for_status()
+    reply = orjson.loads(response.content)['choices'][0]['message']['content']
+    store_reply(key, reply)
+    return reply
+
+def get_gpt_responses(prompts, history=[]):
+    """Answer several independent prompts with a single chat completion, in order"""
+    if not prompts:
+        return []
+    if len(prompts) == 1:
+        return [get_gpt_response(prompts[0], history)]
+    
+    messages = [_SYSTEM_MSG] + _trim_history(history, HISTORY_TOKEN_BUDGET)
+    key = gpt_key({"model": GPT_MODEL, "messages": messages, "prompts": list(prompts)})
+    try:
+        cached = get_cached_reply(key)
+        if cached is not None:
+            return orjson.loads(cached)
+        answers = fetch_batch_answers(_OPENAI_SESSION, GPT_MODEL, messages, prompts)
+        store_reply(key, orjson.dumps(answers).decode())
+        return answers
+    except (requests.RequestException, ValueError):
+        pass
+    
+    # Fall back to one request per prompt if the combined reply cannot be split
+    return [get_gpt_response(prompt, history) for prompt in prompts]
+
+def _trim_history(history, max_tokens):
+    """Keep the most recent messages whose combined length fits in max_tokens"""
+    trimmed = []
+    used = 0
+    for message in reversed(history):
+        used += _count_tokens(message["content"])
+        if used > max_tokens:
+            break
+        trimmed.append(message)
+    trimmed.reverse()
+    return trimmed
+
+def _count_tokens(text):
+    """Count tokens with tiktoken when available, otherwise estimate ~4 characters per token"""
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    return len(text) // 4 + 1
 
 # App
 st.set_page_config(page_title="Voice Healthcare Assistant", layout="centered")
@@ -79,7 +157,7 @@ st.markdown("""
     }
 
     function unlockAudioPlayback() {
-        const silentAudio = new Audio('data:audio/mp3;base64,SUQzBAAAAAAAI1RTU0UAAAAPAAADTGF2ZjU4LjI5LjEwMAAAAAAAAAAAAAAA...');
+        const silentAudio = new Audio('app/static/silent.mp3');
         silentAudio.play().then(() => {
             console.log('Audio playback unlocked');
             localStorage.setItem('audioUnlocked', 'true');
@@ -112,10 +190,11 @@ Voice will autoplay after your first interaction.
 
 user_input = st.text_input("Your question:")
 if user_input:
-    st.session_state.conversation.append({"role": "user", "content": user_input})
     reply = get_gpt_response(user_input, st.session_state.conversation)
+    st.session_state.conversation.append({"role": "user", "content": user_input})
     st.session_state.conversation.append({"role": "assistant", "content": reply})
+    # Streamlit sends the text to the browser right away, so it is already shown while the audio downloads
     st.markdown(f"**Assistant:** {reply}")
     audio_file = text_to_speech(reply)
     if audio_file:
-        st.audio(audio_file, format="audio/mp3")
\ No newline at end of file
+        st.audio(audio_file, format=AUDIO_MIME_TYPES[AUDIO_SUFFIXES[TTS_FORMAT]])
\ No newline at end of file
@@ -0,0 +1,138 @@
+import logging
+import time
+import orjson
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from cache import AUDIO_SUFFIXES, TTS_FORMAT, tts_key, get_cached_audio, store_audio
+from openai_client import SPEECH_URL, create_openai_session, openai_retry
+
+logger = logging.getLogger(__name__)
+
+# Shared OpenAI session; Content-Type is left per request so file uploads can use multipart.
+# Only speech synthesis retries POSTs: resending a file upload or batch creation after a 5xx
+# could leave duplicate (paid) batch jobs behind.
+_OPENAI_SESSION = create_openai_session(pool_maxsize=8, retry_methods=("GET",), json_body=False)
+_OPENAI_SESSION.mount(SPEECH_URL, HTTPAdapter(pool_connections=1, pool_maxsize=8, max_retries=openai_retry(("POST",))))
+
+# Worker threads for pre-generating TTS audio outside the interactive app
+_TTS_POOL = ThreadPoolExecutor(max_workers=4)
+
+# Chat model used for batched reminder generation
+GPT_MODEL = "gpt-4o-mini"
+# TTS settings; these must match text_to_speech in both apps so pre-generated audio is found in the cache
+TTS_MODEL = "tts-1"
+TTS_VOICE = "nova"
+
+REMINDER_PROMPT = (
+    "You write short, friendly SMS medication reminders for elderly patients. "
+    "Use at most 160 characters, plain words, and sign off as 'your healthcare assistant'."
+)
+
+# Batch statuses after which the batch will not change any more
+_FINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+def generate_reminder_messages(reminders, max_wait=24 * 3600):
+    """Generate reminder SMS texts through the Batch API, in the same order as reminders.
+    
+    Each reminder is a dict with user_name and medication_name. Entries that could
+    not be generated are None, so callers can fall back to the default message.
+    """
+    batch_id = submit_reminder_batch(reminders)
+    batch = wait_for_batch(batch_id, max_wait=max_wait)
+    messages = fetch_batch_results(batch)
+    return [messages.get(f"reminder-{i}") for i in range(len(reminders))]
+
+def submit_reminder_batch(reminders):
+    """Upload reminder requests as a JSONL batch file and start a 24h batch job"""
+    lines = []
+    for i, reminder in enumerate(reminders):
+        body = {
+            "model": GPT_MODEL,
+            "messages": [
+                {"role": "system", "content": REMINDER_PROMPT},
+                {"role": "user", "content": f"Patient: {reminder['user_name']}. Medication: {reminder['medication_name']}."}
+            ],
+            "max_tokens": 100
+        }
+        lines.append(orjson.dumps({
+            "custom_id": f"reminder-{i}",
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": body
+        }))
+    
+    upload = _OPENAI_SESSION.post(
+        "https://api.openai.com/v1/files",
+        data={"purpose": "batch"},
+        files={"file": ("reminders.jsonl", b"\n".join(lines), "application/jsonl")}
+    )
+    upload.raise_for_status()
+    
+    response = _OPENAI_SESSION.post(
+        "https://api.openai.com/v1/batches",
+        json={
+            "input_file_id": upload.json()["id"],
+            "endpoint": "/v1/chat/completions",
+            "completion_window": "24h"
+        }
+    )
+    response.raise_for_status()
+    return response.json()["id"]
+
+def wait_for_batch(batch_id, max_wait=24 * 3600, initial_delay=30, max_delay=600):
+    """Poll a batch with exponential backoff until it reaches a final status"""
+    deadline = time.monotonic() + max_wait
+    delay = initial_delay
+    while True:
+        response = _OPENAI_SESSION.get(f"https://api.openai.com/v1/batches/{batch_id}")
+        response.raise_for_status()
+        batch = response.json()
+        if batch["status"] in _FINAL_STATUSES:
+            return batch
+        if time.monotonic() + delay > deadline:
+            raise TimeoutError(f"Batch {batch_id} still {batch['status']} after {max_wait} seconds")
+        time.sleep(delay)
+        delay = min(delay * 2, max_delay)
+
+def fetch_batch_results(batch):
+    """Download a finished batch's output file and return {custom_id: reply text}"""
+    if not batch.get("output_file_id"):
+        return {}
+    
+    response = _OPENAI_SESSION.get(f"https://api.openai.com/v1/files/{batch['output_file_id']}/content")
+    response.raise_for_status()
+    
+    results = {}
+    for line in response.content.splitlines():
+        record = orjson.loads(line)
+        result = record.get("response") or {}
+        if result.get("status_code") == 200:
+            results[record["custom_id"]] = result["body"]["choices"][0]["message"]["content"]
+    return results
+
+def pregenerate_tts(texts):
+    """Synthesize audio for texts into the TTS cache so the app later serves them as cache hits"""
+    return list(_TTS_POOL.map(_synthesize_to_cache, texts))
+
+def _synthesize_to_cache(text):
+    """Synthesize one text into the TTS cache, returning its path or None on failure"""
+    payload = {
+        "model": TTS_MODEL,
+        "input": text[:4096],
+        "voice": TTS_VOICE,
+        "response_format": TTS_FORMAT
+    }
+    key = tts_key(payload["input"], TTS_MODEL, TTS_VOICE, TTS_FORMAT)
+    cached_file = get_cached_audio(key, suffix=AUDIO_SUFFIXES[TTS_FORMAT])
+    if cached_file:
+        return cached_file
+    try:
+        with _OPENAI_SESSION.post(SPEECH_URL, json=payload, stream=True) as response:
+            if response.status_code == 200:
+                return store_audio(key, response.iter_content(chunk_size=16384), suffix=AUDIO_SUFFIXES[TTS_FORMAT])
+    except OSError as e:
+        # Covers both request and cache-write errors; one failed text must not abort the rest of the run
+        logger.warning("Text-to-speech pre-generation failed: %s", e)
+        return None
+    logger.warning("Text-to-speech pre-generation failed: %s", response.status_code)
+    return None
@@ -0,0 +1,113 @@
+import hashlib
+import logging
+import orjson
+import os
+import threading
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Cache directories for generated TTS audio and GPT replies
+CACHE_DIR = os.getenv("CACHE_DIR", ".cache")
+TTS_CACHE_DIR = os.path.join(CACHE_DIR, "tts")
+GPT_CACHE_DIR = os.path.join(CACHE_DIR, "gpt")
+
+# Maximum number of files kept per cache; least recently used files are evicted first
+TTS_CACHE_MAX_ENTRIES = 512
+GPT_CACHE_MAX_ENTRIES = 2048
+
+# File suffix for each TTS response_format; OpenAI returns opus inside an Ogg container
+AUDIO_SUFFIXES = {"mp3": ".mp3", "opus": ".ogg", "aac": ".aac", "flac": ".flac", "wav": ".wav"}
+# MIME type st.audio needs for each cached audio file suffix
+AUDIO_MIME_TYPES = {".mp3": "audio/mp3", ".ogg": "audio/ogg", ".aac": "audio/aac", ".flac": "audio/flac", ".wav": "audio/wav"}
+
+# Audio format requested from TTS, shared by both apps and batch pre-generation so all of them use
+# the same cache keys; opus is roughly 40% smaller than mp3 at similar quality. Set TTS_FORMAT=mp3 for
+# browsers that cannot play Ogg Opus.
+TTS_FORMAT = os.getenv("TTS_FORMAT", "opus")
+if TTS_FORMAT not in AUDIO_SUFFIXES:
+    logger.warning("Unsupported TTS_FORMAT %r, using mp3", TTS_FORMAT)
+    TTS_FORMAT = "mp3"
+
+# Hit/miss counters for observability
+cache_stats = {"hits": 0, "misses": 0}
+
+def tts_key(text, model, voice, response_format):
+    """Build a deterministic cache key for a TTS request"""
+    return hashlib.sha256(f"{voice}|{model}|{response_format}|{text}".encode()).hexdigest()
+
+def gpt_key(payload):
+    """Build a deterministic cache key for a chat completion payload"""
+    return hashlib.sha256(orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+def get_cached_audio(key, suffix=".mp3"):
+    """Return the path of a cached audio file, or None if it is not cached"""
+    path = os.path.join(TTS_CACHE_DIR, key + suffix)
+    return path if _lookup(path) else None
+
+def store_audio(key, chunks, suffix=".mp3"):
+    """Write audio chunks into the cache and return the cached file path"""
+    path = os.path.join(TTS_CACHE_DIR, key + suffix)
+    _write_atomic(path, chunks)
+    _evict(TTS_CACHE_DIR, TTS_CACHE_MAX_ENTRIES)
+    return path
+
+def get_cached_reply(key):
+    """Return a cached GPT reply, or None if it is not cached"""
+    path = os.path.join(GPT_CACHE_DIR, key + ".txt")
+    if not _lookup(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+def store_reply(key, reply):
+    """Store a GPT reply in the cache"""
+    path = os.path.join(GPT_CACHE_DIR, key + ".txt")
+    _write_atomic(path, [reply.encode("utf-8")])
+    _evict(GPT_CACHE_DIR, GPT_CACHE_MAX_ENTRIES)
+
+def _lookup(path):
+    """Check for a cache entry and mark it as recently used"""
+    try:
+        os.utime(path, None)
+    except OSError:
+        cache_stats["misses"] += 1
+        return False
+    cache_stats["hits"] += 1
+    return True
+
+def _write_atomic(path, chunks):
+    """Write chunks to a temporary file and move it into place once complete"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def _evict(directory, max_entries):
+    """Remove the least recently used files once a cache grows past max_entries"""
+    entries = [entry for entry in os.scandir(directory) if entry.is_file() and not entry.name.endswith(".tmp")]
+    if len(entries) <= max_entries:
+        return
+    entries.sort(key=_mtime)
+    for entry in entries[:len(entries) - max_entries]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+def _mtime(entry):
+    """Modification time of a cache entry, or 0 if another thread or process already removed it"""
+    try:
+        return entry.stat().st_mtime
+    except OSError:
+        return 0
@@ -1,23 +1,99 @@
 import requests
 import base64
-import datetime
-import json
+from dataclasses import dataclass
+from datetime import datetime
+import functools
+import logging
+import orjson
 import os
+import re
+import string
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # 46elks API credentials from .env
 ELKS_API_USERNAME = os.getenv("ELKS_API_USERNAME")
 ELKS_API_PASSWORD = os.getenv("ELKS_API_PASSWORD")
 ELKS_FROM_NUMBER = os.getenv("ELKS_FROM_NUMBER")
 WEBHOOK_URL = os.getenv("WEBHOOK_URL")
 
+# Basic-Auth header for 46elks, computed once since the credentials never change
+_ELKS_AUTH = "Basic " + base64.b64encode(f"{ELKS_API_USERNAME}:{ELKS_API_PASSWORD}".encode()).decode()
+_ELKS_HEADERS = {
+    "Authorization": _ELKS_AUTH,
+    "Content-Type": "application/x-www-form-urlencoded"
+}
+
+# Shared 46elks session so calls and SMS reuse the same keep-alive connection.
+# Retry keeps urllib3's default allowed_methods, so a POST that reached 46elks
+# is never resent (that would dial the pharmacy twice).
+_ELKS_SESSION = requests.Session()
+_ELKS_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=10,
+    pool_maxsize=20,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504])
+))
+_ELKS_SESSION.headers.update(_ELKS_HEADERS)
+
+# Worker threads for fanning out batches of 46elks requests
+_ELKS_POOL = ThreadPoolExecutor(max_workers=10)
+
+# Upper bound on 46elks requests started per second by batch dispatch
+ELKS_MAX_REQUESTS_PER_SECOND = 30
+_elks_rate_lock = threading.Lock()
+_elks_next_slot = 0.0
+
+# Identical reservation calls within this window (double clicks, retries) reuse the first result
+RESERVATION_DEDUP_SECONDS = 600
+_recent_reservations = {}
+_recent_reservations_lock = threading.Lock()
+reservation_cache_stats = {"hits": 0, "misses": 0}
+
+# Voice XML templates, compiled once and kept on a single line so no indentation goes over the wire
+_IVR_RESERVE_TMPL = string.Template(
+    '<?xml version="1.0" encoding="UTF-8"?>'
+    '<ivr><play><voice>'
+    'This is a call from the Healthcare Assistant app on behalf of $user_name. '
+    'A request has been made to reserve $quantity of $medication_name. '
+    'If you can fulfill this request, please call $user_phone to confirm. '
+    'Thank you.'
+    '</voice></play></ivr>'
+)
+_IVR_NOTIFY_TMPL = string.Template(
+    '<?xml version="1.0" encoding="UTF-8"?>'
+    '<ivr><play><voice>$message</voice></play>'
+    '<gather timeout="5" numdigits="1"><play>'
+    '<voice>Press 1 to confirm you received this message.</voice>'
+    '</play></gather></ivr>'
+)
+_NOTIFY_CONFIRMED_TMPL = string.Template(
+    'Hello $user_name, this is your healthcare assistant. '
+    'Good news! Your reservation for $quantity of $medication_name has been accepted by $pharmacy_name. '
+    'You can pick up your medication at your convenience.'
+)
+_NOTIFY_DECLINED_TMPL = string.Template(
+    'Hello $user_name, this is your healthcare assistant. '
+    'Unfortunately, $pharmacy_name was unable to fulfill your reservation for $medication_name. '
+    'You may want to try a different pharmacy.'
+)
+
+# Everything except digits and a leading + is stripped from phone numbers
+_NON_PHONE_CHARS = re.compile(r"(?!^\+)\D")
+
+@functools.lru_cache(maxsize=4096)
 def format_phone_number(phone):
     """Format phone number to ensure it has a country code"""
     # Remove any spaces, dashes, or parentheses
-    phone = ''.join(filter(str.isdigit, phone))
+    phone = _NON_PHONE_CHARS.sub('', phone)
     
     # If the number doesn't start with +, add +46 (Sweden country code)
     if not phone.startswith('+'):
@@ -30,39 +106,50 @@ def format_phone_number(phone):
             
     return phone
 
+@dataclass(frozen=True, slots=True)
+class E164:
+    """A phone number already normalized to international format"""
+    value: str
+    
+    @classmethod
+    def from_raw(cls, phone):
+        """Normalize a raw phone number once, at the input boundary"""
+        return cls(format_phone_number(phone))
+    
+    def __str__(self):
+        return self.value
+
+def _as_e164(phone):
+    """Return the formatted number, trusting values that are already E164"""
+    if isinstance(phone, E164):
+        return phone.value
+    return format_phone_number(phone)
+
 def make_reservation_call(user_name, user_phone, pharmacy, medication_name, quantity):
     """Make a reservation call to the pharmacy using 46elks API with IVR"""
-    # Format phone numbers correctly for Sweden
-    user_phone = format_phone_number(user_phone)
-    pharmacy_phone = format_phone_number(pharmacy.get("phone", ""))
+    # Format phone numbers correctly for Sweden; E164 values are already formatted
+    user_phone = _as_e164(user_phone)
+    pharmacy_phone = _as_e164(pharmacy.get("phone", ""))
     
-    # For development/testing purposes, print the actual numbers being used
-    print(f"User phone: {user_phone}")
-    print(f"Pharmacy phone: {pharmacy_phone}")
+    # Skip the call if an identical reservation was placed recently
+    dedup_key = ("ivr", user_phone, pharmacy_phone, medication_name, quantity)
+    recent_result = _get_recent_reservation(dedup_key)
+    if recent_result:
+        return recent_result
+    
+    # For development/testing purposes, log the actual numbers being used
+    logger.debug("User phone: %s", user_phone)
+    logger.debug("Pharmacy phone: %s", pharmacy_phone)
     
     # Create voice XML content
-    voice_start = f"""
-    <?xml version="1.0" encoding="UTF-8"?>
-    <ivr>
-        <play>
-            <voice>
-                This is a call from the Healthcare Assistant app on behalf of {user_name}.
-                A request has been made to reserve {quantity} of {medication_name}.
-                If you can fulfill this request, please call {user_phone} to confirm.
-                Thank you.
-            </voice>
-        </play>
-    </ivr>
-    """
+    voice_start = _IVR_RESERVE_TMPL.substitute(
+        user_name=user_name,
+        quantity=quantity,
+        medication_name=medication_name,
+        user_phone=user_phone
+    )
     
     try:
-        # Set up authentication for 46elks API
-        auth = base64.b64encode(f"{ELKS_API_USERNAME}:{ELKS_API_PASSWORD}".encode()).decode()
-        headers = {
-            "Authorization": f"Basic {auth}",
-            "Content-Type": "application/x-www-form-urlencoded"
-        }
-        
         # Prepare the payload for the call
         payload = {
             "from": ELKS_FROM_NUMBER,
@@ -71,29 +158,31 @@ def make_reservation_call(user_name, user_phone, pharmacy, medication_name, quan
             "next": WEBHOOK_URL  # Webhook for call status updates
         }
         
-        # For debug purposes, print the payload
-        print(f"Payload: {payload}")
+        # For debug purposes, log the payload
+        logger.debug("Payload: %s", payload)
         
         # Make the API request to 46elks
-        response = requests.post(
+        response = _ELKS_SESSION.post(
             "https://api.46elks.com/a1/calls",
-            headers=headers,
             data=payload
         )
         
-        # Log the complete response for debugging
-        print(f"46elks response status: {response.status_code}")
-        print(f"46elks response content: {response.text}")
+        # Log the complete response for debugging; response.text is only decoded when debug logging is on
+        logger.debug("46elks response status: %s", response.status_code)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("46elks response content: %s", response.text)
         
         if response.status_code == 200:
-            call_info = response.json()
-            return {
+            call_info = orjson.loads(response.content)
+            result = {
                 "success": True,
                 "message": "Call initiated successfully",
                 "call_id": call_info.get("id", ""),
                 "reservation_id": f"res_{datetime.now().strftime('%Y%m%d%H%M%S')}",
                 "call_type": "ivr"
             }
+            _remember_reservation(dedup_key, result)
+            return result
         else:
             return {
                 "success": False,
@@ -101,7 +190,7 @@ def make_reservation_call(user_name, user_phone, pharmacy, medication_name, quan
             }
             
     except Exception as e:
-        print(f"Exception details: {str(e)}")
+        logger.error("Exception details: %s", e)
         return {
             "success": False,
             "message": f"Exception during call initiation: {str(e)}"
@@ -109,21 +198,24 @@ def make_reservation_call(user_name, user_phone, pharmacy, medication_name, quan
 
 def make_connect_reservation_call(user_name, user_phone, pharmacy, medication_name, quantity):
     """Make a reservation call to the pharmacy and connect to the user using 46elks API"""
-    # Format phone numbers correctly for Sweden
-    user_phone = format_phone_number(user_phone)
-    pharmacy_phone = format_phone_number(pharmacy.get("phone", ""))
+    # Format phone numbers correctly for Sweden; E164 values are already formatted
+    user_phone = _as_e164(user_phone)
+    pharmacy_phone = _as_e164(pharmacy.get("phone", ""))
+    
+    # Skip the call if an identical reservation was placed recently
+    dedup_key = ("connect", user_phone, pharmacy_phone, medication_name, quantity)
+    recent_result = _get_recent_reservation(dedup_key)
+    if recent_result:
+        return recent_result
     
-    # For development/testing purposes, print the actual numbers being used
-    print(f"User phone: {user_phone}")
-    print(f"Pharmacy phone: {pharmacy_phone}")
+    # For development/testing purposes, log the actual numbers being used
+    logger.debug("User phone: %s", user_phone)
+    logger.debug("Pharmacy phone: %s", pharmacy_phone)
     
     # Create voice_start JSON for connect action
-    voice_start = json.dumps({"connect": user_phone})
+    voice_start = orjson.dumps({"connect": user_phone}).decode()
     
     try:
-        # Set up authentication for 46elks API
-        auth = (ELKS_API_USERNAME, ELKS_API_PASSWORD)
-        
         # Prepare the payload for the call
         payload = {
             "from": ELKS_FROM_NUMBER,
@@ -132,29 +224,31 @@ def make_connect_reservation_call(user_name, user_phone, pharmacy, medication_na
             "next": WEBHOOK_URL  # Webhook for call status updates
         }
         
-        # For debug purposes, print the payload
-        print(f"Payload: {payload}")
+        # For debug purposes, log the payload
+        logger.debug("Payload: %s", payload)
         
         # Make the API request to 46elks
-        response = requests.post(
+        response = _ELKS_SESSION.post(
             "https://api.46elks.com/a1/calls",
-            auth=auth,
             data=payload
         )
         
-        # Log the complete response for debugging
-        print(f"46elks response status: {response.status_code}")
-        print(f"46elks response content: {response.text}")
+        # Log the complete response for debugging; response.text is only decoded when debug logging is on
+        logger.debug("46elks response status: %s", response.status_code)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("46elks response content: %s", response.text)
         
         if response.status_code == 200:
-            call_info = response.json()
-            return {
+            call_info = orjson.loads(response.content)
+            result = {
                 "success": True,
                 "message": "Connect call initiated successfully",
                 "call_id": call_info.get("id", ""),
                 "reservation_id": f"res_{datetime.now().strftime('%Y%m%d%H%M%S')}",
                 "call_type": "connect"
             }
+            _remember_reservation(dedup_key, result)
+            return result
         else:
             return {
                 "success": False,
@@ -162,7 +256,7 @@ def make_connect_reservation_call(user_name, user_phone, pharmacy, medication_na
             }
             
     except Exception as e:
-        print(f"Exception details: {str(e)}")
+        logger.error("Exception details: %s", e)
         return {
             "success": False,
             "message": f"Exception during connect call initiation: {str(e)}"
@@ -170,46 +264,22 @@ def make_connect_reservation_call(user_name, user_phone, pharmacy, medication_na
 
 def notify_user_via_call(user_name, user_phone, reservation_status, pharmacy_name, medication_name, quantity):
     """Call the user to notify them about their reservation status"""
-    # Format phone number
-    user_phone = format_phone_number(user_phone)
+    # Format phone number; E164 values are already formatted
+    user_phone = _as_e164(user_phone)
     
     # Create voice message based on status
-    if reservation_status == 'confirmed':
-        message = f"""
-        Hello {user_name}, this is your healthcare assistant.
-        Good news! Your reservation for {quantity} of {medication_name} has been accepted by {pharmacy_name}.
-        You can pick up your medication at your convenience.
-        """
-    else:
-        message = f"""
-        Hello {user_name}, this is your healthcare assistant.
-        Unfortunately, {pharmacy_name} was unable to fulfill your reservation for {medication_name}.
-        You may want to try a different pharmacy.
-        """
+    message_tmpl = _NOTIFY_CONFIRMED_TMPL if reservation_status == 'confirmed' else _NOTIFY_DECLINED_TMPL
+    message = message_tmpl.substitute(
+        user_name=user_name,
+        quantity=quantity,
+        medication_name=medication_name,
+        pharmacy_name=pharmacy_name
+    )
     
     # Create voice XML content
-    voice_start = f"""
-    <?xml version="1.0" encoding="UTF-8"?>
-    <ivr>
-        <play>
-            <voice>{message}</voice>
-        </play>
-        <gather timeout="5" numdigits="1">
-            <play>
-                <voice>Press 1 to confirm you received this message.</voice>
-            </play>
-        </gather>
-    </ivr>
-    """
+    voice_start = _IVR_NOTIFY_TMPL.substitute(message=message)
     
     try:
-        # Set up authentication for 46elks API
-        auth = base64.b64encode(f"{ELKS_API_USERNAME}:{ELKS_API_PASSWORD}".encode()).decode()
-        headers = {
-            "Authorization": f"Basic {auth}",
-            "Content-Type": "application/x-www-form-urlencoded"
-        }
-        
         # Prepare the payload for the call
         payload = {
             "from": ELKS_FROM_NUMBER,
@@ -220,14 +290,13 @@ def notify_user_via_call(user_name, user_phone, reservation_status, pharmacy_nam
         }
         
         # Make the API request to 46elks
-        response = requests.post(
+        response = _ELKS_SESSION.post(
             "https://api.46elks.com/a1/calls",
-            headers=headers,
             data=payload
         )
         
         if response.status_code == 200:
-            call_info = response.json()
+            call_info = orjson.loads(response.content)
             return {
                 "success": True,
                 "message": "Notification call initiated successfully",
@@ -245,22 +314,16 @@ def notify_user_via_call(user_name, user_phone, reservation_status, pharmacy_nam
             "message": f"Exception during notification call: {str(e)}"
         }
 
-def send_reminder_sms(user_name, user_phone, medication_name, time):
-    """Send an SMS reminder to take medication"""
-    # Format phone number
-    user_phone = format_phone_number(user_phone)
+def send_reminder_sms(user_name, user_phone, medication_name, time, message=None):
+    """Send an SMS reminder to take medication, optionally with a pre-generated message"""
+    # Format phone number; E164 values are already formatted
+    user_phone = _as_e164(user_phone)
     
     # Create SMS message
-    message = f"Hello {user_name}, this is your healthcare assistant. It's time to take your {medication_name}."
+    if not message:
+        message = f"Hello {user_name}, this is your healthcare assistant. It's time to take your {medication_name}."
     
     try:
-        # Set up authentication for 46elks API
-        auth = base64.b64encode(f"{ELKS_API_USERNAME}:{ELKS_API_PASSWORD}".encode()).decode()
-        headers = {
-            "Authorization": f"Basic {auth}",
-            "Content-Type": "application/x-www-form-urlencoded"
-        }
-        
         # Prepare the payload for the SMS
         payload = {
             "from": "HealthApp",
@@ -269,14 +332,13 @@ def send_reminder_sms(user_name, user_phone, medication_name, time):
         }
         
         # Make the API request to 46elks
-        response = requests.post(
+        response = _ELKS_SESSION.post(
             "https://api.46elks.com/a1/sms",
-            headers=headers,
             data=payload
         )
         
         if response.status_code == 200:
-            sms_info = response.json()
+            sms_info = orjson.loads(response.content)
             return {
                 "success": True,
                 "message": "SMS sent successfully",
@@ -292,4 +354,52 @@ def send_reminder_sms(user_name, user_phone, medication_name, time):
         return {
             "success": False,
             "message": f"Exception during SMS sending: {str(e)}"
-        }
\ No newline at end of file
+        }
+
+def _get_recent_reservation(key):
+    """Return the result of an identical reservation call placed within the dedup window"""
+    now = time.monotonic()
+    with _recent_reservations_lock:
+        # Entries are stored oldest first, so expired ones are always at the front
+        while _recent_reservations:
+            oldest_key = next(iter(_recent_reservations))
+            if now - _recent_reservations[oldest_key][0] <= RESERVATION_DEDUP_SECONDS:
+                break
+            del _recent_reservations[oldest_key]
+        entry = _recent_reservations.get(key)
+    
+    if entry is None:
+        reservation_cache_stats["misses"] += 1
+        return None
+    
+    reservation_cache_stats["hits"] += 1
+    logger.info("Duplicate reservation call skipped, cache stats: %s", reservation_cache_stats)
+    return dict(entry[1])
+
+def _remember_reservation(key, result):
+    """Remember a successful reservation call for the dedup window"""
+    with _recent_reservations_lock:
+        _recent_reservations.pop(key, None)
+        _recent_reservations[key] = (time.monotonic(), dict(result))
+
+def broadcast_reminders(reminders):
+    """Send many SMS reminders concurrently, returning results in the same order.
+    
+    Each reminder is a dict of send_reminder_sms keyword arguments.
+    """
+    return list(_ELKS_POOL.map(_send_reminder_rate_limited, reminders))
+
+def _send_reminder_rate_limited(reminder):
+    """Wait for a free rate-limit slot, then send a single reminder"""
+    _wait_for_rate_limit()
+    return send_reminder_sms(**reminder)
+
+def _wait_for_rate_limit():
+    """Block until the next request slot allowed by ELKS_MAX_REQUESTS_PER_SECOND"""
+    global _elks_next_slot
+    with _elks_rate_lock:
+        now = time.monotonic()
+        slot = max(_elks_next_slot, now)
+        _elks_next_slot = slot + 1.0 / ELKS_MAX_REQUESTS_PER_SECOND
+    if slot > now:
+        time.sleep(slot - now)
@@ -0,0 +1,21 @@
+import multiprocessing
+import os
+import sys
+
+# Gunicorn settings for the 46elks webhook; start it with `gunicorn webhook:app`
+bind = os.getenv("WEBHOOK_BIND", "0.0.0.0:5000")
+
+# gevent workers multiplex many concurrent callbacks per process over keep-alive connections
+worker_class = "gevent"
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_connections = 1000
+keepalive = 5
+
+# Import the app in each worker after fork, so every worker opens its own log files, lock and logging thread
+preload_app = False
+
+def worker_exit(server, worker):
+    """Flush the worker's buffered webhook log lines before it exits"""
+    webhook = sys.modules.get("webhook")
+    if webhook is not None:
+        webhook._flush_logs()
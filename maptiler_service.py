@@ -1,62 +1,171 @@
 import requests
+import functools
+import logging
+import orjson
 import math
-import random
 import os
+import numpy as np
+from scipy.spatial import cKDTree
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    from numba import njit
+except ImportError:  # numba is optional; the pure Python/NumPy kernels are used without it
+    njit = None
 
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # MapTiler API key from .env
 MAPTILER_API_KEY = os.getenv("MAPTILER_API_KEY")
 
+# Random generator for placeholder phone numbers (PCG64)
+_PHONE_RNG = np.random.default_rng()
+
+# Shared MapTiler session so geocoding and pharmacy lookups reuse the same connection
+_MAPTILER_SESSION = requests.Session()
+_MAPTILER_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=10,
+    pool_maxsize=20,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504])
+))
+
+# Earth radius in kilometers
+EARTH_RADIUS_KM = 6371.0
+
+# Real Stockholm pharmacies with their approximate coordinates
+_STOCKHOLM_PHARMACIES = [
+    {
+        "name": "Apoteket Hjärtat",
+        "address": "Sergels Torg 12, Stockholm",
+        "coordinates": (59.3327, 18.0649),
+        "phone": "+46812345678"
+    },
+    {
+        "name": "Kronans Apotek",
+        "address": "Drottninggatan 65, Stockholm",
+        "coordinates": (59.3336, 18.0627),
+        "phone": "+46823456789"
+    },
+    {
+        "name": "Apotek Fönix",
+        "address": "Kungsgatan 32, Stockholm",
+        "coordinates": (59.3356, 18.0551),
+        "phone": "+46834567890"
+    },
+    {
+        "name": "Lloyds Apotek",
+        "address": "Birger Jarlsgatan 22, Stockholm",
+        "coordinates": (59.3361, 18.0711),
+        "phone": "+46845678901"
+    },
+    {
+        "name": "Apotea Cityapotek",
+        "address": "Sveavägen 24, Stockholm",
+        "coordinates": (59.3376, 18.0605),
+        "phone": "+46856789012"
+    },
+    {
+        "name": "Apoteksgruppen",
+        "address": "Odengatan 50, Stockholm",
+        "coordinates": (59.3468, 18.0621),
+        "phone": "+46867890123"
+    },
+    {
+        "name": "Apotek ICA Maxi",
+        "address": "Kungens Kurva, Stockholm",
+        "coordinates": (59.2751, 17.9254),
+        "phone": "+46878901234"
+    }
+]
+
+# Pharmacy coordinates in radians, precomputed for vectorized distance queries
+_STOCKHOLM_LATS = np.radians(np.array([p["coordinates"][0] for p in _STOCKHOLM_PHARMACIES], dtype=np.float64))
+_STOCKHOLM_LONS = np.radians(np.array([p["coordinates"][1] for p in _STOCKHOLM_PHARMACIES], dtype=np.float64))
+
+def _to_unit_vectors(lats, lons):
+    """Convert coordinates in radians to 3D points on the unit sphere"""
+    cos_lats = np.cos(lats)
+    return np.column_stack((cos_lats * np.cos(lons), cos_lats * np.sin(lons), np.sin(lats)))
+
+def _chord_length(distance_km):
+    """Straight-line distance on the unit sphere matching a great-circle distance in km"""
+    return 2 * math.sin(distance_km / (2 * EARTH_RADIUS_KM))
+
+# k-d tree over pharmacy positions on the unit sphere; chord length grows monotonically
+# with great-circle distance, so radius and nearest-neighbour queries are exact
+_STOCKHOLM_TREE = cKDTree(_to_unit_vectors(_STOCKHOLM_LATS, _STOCKHOLM_LONS))
+
+# Well-known Stockholm landmarks with more accurate coordinates than the geocoder
+_STOCKHOLM_LANDMARKS = {
+    "sergels torg": (59.3327, 18.0649),
+    "gamla stan": (59.3254, 18.0718),
+    "djurgården": (59.3249, 18.1186)
+}
+
 def geocode_address(address, api_key=MAPTILER_API_KEY):
     """Convert address to geographical coordinates using MapTiler's Geocoding API"""
+    # Use Stockholm coordinates as default if geocoding fails
+    default_lat, default_lon = 59.3293, 18.0686  # Stockholm coordinates
+    
     try:
-        # Use Stockholm coordinates as default if geocoding fails
-        default_lat, default_lon = 59.3293, 18.0686  # Stockholm coordinates
-        
         # If address is empty or None, return Stockholm coordinates
         if not address:
             return (default_lat, default_lon)
         
         # If we detect Stockholm in the address, provide more accurate location
-        if "stockholm" in address.lower():
-            if "sergels torg" in address.lower():
-                return (59.3327, 18.0649)  # Sergels Torg
-            if "gamla stan" in address.lower():
-                return (59.3254, 18.0718)  # Gamla Stan
-            if "djurgården" in address.lower():
-                return (59.3249, 18.1186)  # Djurgården
+        address_lower = address.lower()
+        if "stockholm" in address_lower:
+            for landmark, coordinates in _STOCKHOLM_LANDMARKS.items():
+                if landmark in address_lower:
+                    return coordinates
         
         # Try to geocode the address using MapTiler
-        encoded_address = requests.utils.quote(address)
-        url = f"https://api.maptiler.com/geocoding/{encoded_address}.json?key={api_key}&limit=1"
+        coordinates = _geocode_with_maptiler(address, api_key)
+        if coordinates:
+            return coordinates
         
-        response = requests.get(url)
-        
-        if response.status_code == 200:
-            result = response.json()
-            
-            # Check if we got any features back
-            if result.get("features") and len(result["features"]) > 0:
-                # Get coordinates from the first feature
-                coordinates = result["features"][0]["geometry"]["coordinates"]
-                # Return as (latitude, longitude)
-                return (coordinates[1], coordinates[0])
-        
-        # If API call fails or no results, return Stockholm coordinates
-        print(f"Geocoding failed for '{address}', using Stockholm coordinates instead")
+        # If no results, return Stockholm coordinates
+        logger.warning("Geocoding failed for '%s', using Stockholm coordinates instead", address)
         return (default_lat, default_lon)
     except Exception as e:
-        print(f"Error in geocoding: {str(e)}")
+        logger.error("Error in geocoding: %s", e)
         return (default_lat, default_lon)
 
+@functools.lru_cache(maxsize=1024)
+def _geocode_with_maptiler(address, api_key):
+    """Look up an address with MapTiler, caching results per address.
+    
+    Failed requests raise instead of returning, so transient errors are not cached.
+    """
+    encoded_address = requests.utils.quote(address)
+    url = f"https://api.maptiler.com/geocoding/{encoded_address}.json?key={api_key}&limit=1"
+    
+    response = _MAPTILER_SESSION.get(url)
+    if response.status_code != 200:
+        raise LookupError(f"MapTiler geocoding returned {response.status_code}")
+    
+    result = orjson.loads(response.content)
+    
+    # Check if we got any features back
+    if result.get("features"):
+        # Get coordinates from the first feature
+        coordinates = result["features"][0]["geometry"]["coordinates"]
+        # Return as (latitude, longitude)
+        return (coordinates[1], coordinates[0])
+    
+    return None
+
 def calculate_distance(lat1, lon1, lat2, lon2):
     """Calculate the distance between two points using the Haversine formula"""
-    # Earth radius in kilometers
-    R = 6371.0
-    
+    return _haversine(lat1, lon1, lat2, lon2)
+
+def _haversine(lat1, lon1, lat2, lon2):
+    """Haversine distance in km between two points given in degrees"""
     # Convert coordinates from degrees to radians
     lat1_rad = math.radians(lat1)
     lon1_rad = math.radians(lon1)
@@ -70,9 +179,30 @@ def calculate_distance(lat1, lon1, lat2, lon2):
     # Haversine formula
     a = math.sin(dlat / 2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlon / 2)**2
     c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    distance = R * c
+    return EARTH_RADIUS_KM * c
+
+def haversine_vec(lat, lon, lats, lons):
+    """Calculate distances in km from one point to arrays of points (all coordinates in radians)"""
+    dlat = lats - lat
+    dlon = lons - lon
+    a = np.sin(dlat / 2)**2 + np.cos(lat) * np.cos(lats) * np.sin(dlon / 2)**2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+# Compile the distance kernels to native code when numba is installed
+if njit is not None:
+    _haversine = njit(cache=True, fastmath=True)(_haversine)
     
-    return distance
+    # Not parallel: the arrays are tiny, and numba's fallback workqueue threading layer aborts the
+    # process when the kernel is called from several threads at once (it runs on the shared HTTP pool)
+    @njit(cache=True, fastmath=True)
+    def haversine_vec(lat, lon, lats, lons):
+        """Calculate distances in km from one point to arrays of points (all coordinates in radians)"""
+        distances = np.empty(lats.shape[0])
+        cos_lat = math.cos(lat)
+        for i in range(lats.shape[0]):
+            a = math.sin((lats[i] - lat) / 2)**2 + cos_lat * math.cos(lats[i]) * math.sin((lons[i] - lon) / 2)**2
+            distances[i] = 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+        return distances
 
 def find_nearby_pharmacies(address, radius_km=5, api_key=MAPTILER_API_KEY):
     """Find pharmacies near the specified address using MapTiler API"""
@@ -88,115 +218,95 @@ def find_nearby_pharmacies(address, radius_km=5, api_key=MAPTILER_API_KEY):
         # Search for pharmacies near the coordinates using MapTiler
         url = f"https://api.maptiler.com/geocoding/pharmacy.json?key={api_key}&limit=10&proximity={lon},{lat}&bbox=17.5,59.0,18.5,59.5"
         
-        response = requests.get(url)
+        response = _MAPTILER_SESSION.get(url)
         
         if response.status_code == 200:
-            result = response.json()
+            result = orjson.loads(response.content)
             pharmacies = []
             
             # If we have actual results from MapTiler
-            if result.get("features") and len(result["features"]) > 0:
-                for feature in result["features"]:
-                    # Calculate distance from user's location
-                    pharm_lon, pharm_lat = feature["geometry"]["coordinates"]
-                    distance = calculate_distance(lat, lon, pharm_lat, pharm_lon)
+            features = result.get("features") or []
+            if features:
+                # Calculate all distances from user's location in one vectorized pass
+                coords = np.array([feature["geometry"]["coordinates"] for feature in features], dtype=np.float64)
+                distances = haversine_vec(math.radians(lat), math.radians(lon), np.radians(coords[:, 1]), np.radians(coords[:, 0]))
+                
+                # Only include pharmacies within the specified radius, closest first
+                nearby = np.where(distances <= radius_km)[0]
+                for i in nearby[np.argsort(distances[nearby], kind="stable")]:
+                    pharm_lon, pharm_lat = features[i]["geometry"]["coordinates"]
                     
-                    # Only include pharmacies within the specified radius
-                    if distance <= radius_km:
-                        # Extract pharmacy details
-                        properties = feature.get("properties", {})
-                        
-                        pharmacy = {
-                            "name": properties.get("name", "Unknown Pharmacy"),
-                            "address": properties.get("full_address", "Address not available"),
-                            "distance": round(distance, 1),
-                            "coordinates": (pharm_lat, pharm_lon),
-                            "phone": properties.get("phone", generate_swedish_phone())
-                        }
-                        
-                        pharmacies.append(pharmacy)
+                    # Extract pharmacy details
+                    properties = features[i].get("properties", {})
+                    
+                    pharmacy = {
+                        "name": properties.get("name", "Unknown Pharmacy"),
+                        "address": properties.get("full_address", "Address not available"),
+                        "distance": round(float(distances[i]), 1),
+                        "coordinates": (pharm_lat, pharm_lon),
+                        "phone": properties.get("phone")
+                    }
+                    
+                    pharmacies.append(pharmacy)
+                
+                # Fill in placeholder numbers for pharmacies without one in a single batch
+                missing = [pharmacy for pharmacy in pharmacies if not pharmacy["phone"]]
+                for pharmacy, phone in zip(missing, generate_swedish_phones(len(missing))):
+                    pharmacy["phone"] = phone
                 
                 # If we got results from the API, return them
                 if pharmacies:
-                    # Sort by distance
-                    pharmacies.sort(key=lambda x: x["distance"])
                     return pharmacies
             
             # If no results or API fails, fall back to Stockholm pharmacies
-            print("No results from MapTiler API, using realistic Swedish pharmacy data")
+            logger.info("No results from MapTiler API, using realistic Swedish pharmacy data")
             return get_stockholm_pharmacies(lat, lon)
     
     except Exception as e:
-        print(f"Error using MapTiler API: {str(e)}")
+        logger.error("Error using MapTiler API: %s", e)
         return get_stockholm_pharmacies(lat, lon)
 
 def get_stockholm_pharmacies(lat, lon):
     """Generate realistic Stockholm pharmacy data based on the provided coordinates"""
-    # Real Stockholm pharmacies with their approximate coordinates
-    stockholm_pharmacies = [
-        {
-            "name": "Apoteket Hjärtat",
-            "address": "Sergels Torg 12, Stockholm",
-            "coordinates": (59.3327, 18.0649),
-            "phone": "+46812345678"
-        },
-        {
-            "name": "Kronans Apotek",
-            "address": "Drottninggatan 65, Stockholm",
-            "coordinates": (59.3336, 18.0627),
-            "phone": "+46823456789"
-        },
-        {
-            "name": "Apotek Fönix",
-            "address": "Kungsgatan 32, Stockholm",
-            "coordinates": (59.3356, 18.0551),
-            "phone": "+46834567890"
-        },
-        {
-            "name": "Lloyds Apotek",
-            "address": "Birger Jarlsgatan 22, Stockholm",
-            "coordinates": (59.3361, 18.0711),
-            "phone": "+46845678901"
-        },
-        {
-            "name": "Apotea Cityapotek",
-            "address": "Sveavägen 24, Stockholm",
-            "coordinates": (59.3376, 18.0605),
-            "phone": "+46856789012"
-        },
-        {
-            "name": "Apoteksgruppen",
-            "address": "Odengatan 50, Stockholm",
-            "coordinates": (59.3468, 18.0621),
-            "phone": "+46867890123"
-        },
-        {
-            "name": "Apotek ICA Maxi",
-            "address": "Kungens Kurva, Stockholm",
-            "coordinates": (59.2751, 17.9254),
-            "phone": "+46878901234"
-        }
-    ]
-    
-    # Calculate distances from provided coordinates
-    for pharmacy in stockholm_pharmacies:
-        pharmacy_lat, pharmacy_lon = pharmacy["coordinates"]
-        distance = calculate_distance(lat, lon, pharmacy_lat, pharmacy_lon)
-        pharmacy["distance"] = round(distance, 1)
-    
-    # Sort by distance
-    stockholm_pharmacies.sort(key=lambda x: x["distance"])
-    
-    # Only return pharmacies within 5km (or all if none are within 5km)
-    nearby_pharmacies = [p for p in stockholm_pharmacies if p["distance"] <= 5]
-    if not nearby_pharmacies:
-        return stockholm_pharmacies[:3]
-    
-    return nearby_pharmacies
+    # Distances are rounded to 0.1 km before filtering and sorting, so every radius query is padded
+    # by half a rounding step to catch pharmacies that round down onto its edge
+    lat_rad, lon_rad = math.radians(lat), math.radians(lon)
+    point = _to_unit_vectors(np.array([lat_rad]), np.array([lon_rad]))[0]
+    
+    # Look up pharmacies within 5km in the spatial index
+    candidates, distances = _stockholm_within(point, lat_rad, lon_rad, 5)
+    limit = None
+    
+    # If none are within 5km, take the 3 closest by rounded distance: fetch every pharmacy that rounds
+    # to at most the third-closest distance, so ties are broken by catalogue order as before
+    if len(candidates) == 0:
+        closest = _STOCKHOLM_TREE.query(point, k=min(3, len(_STOCKHOLM_PHARMACIES)))[1]
+        cutoff = np.round(haversine_vec(lat_rad, lon_rad, _STOCKHOLM_LATS[closest], _STOCKHOLM_LONS[closest]), 1).max()
+        candidates, distances = _stockholm_within(point, lat_rad, lon_rad, cutoff)
+        limit = 3
+    
+    # Sort by distance; the stable sort keeps catalogue order for equal distances
+    order = np.argsort(distances, kind="stable")[:limit]
+    return [dict(_STOCKHOLM_PHARMACIES[candidates[i]], distance=float(distances[i])) for i in order]
+
+def _stockholm_within(point, lat, lon, radius_km):
+    """Catalogue indices, in catalogue order, and rounded distances of Stockholm pharmacies within radius_km"""
+    candidates = np.sort(np.asarray(_STOCKHOLM_TREE.query_ball_point(point, _chord_length(radius_km + 0.051)), dtype=np.intp))
+    distances = np.round(haversine_vec(lat, lon, _STOCKHOLM_LATS[candidates], _STOCKHOLM_LONS[candidates]), 1)
+    within = distances <= radius_km
+    return candidates[within], distances[within]
 
 def generate_swedish_phone():
     """Generate a realistic Swedish phone number"""
-    return f"+467{random.randint(0, 9)}{random.randint(1000000, 9999999)}"
+    return generate_swedish_phones(1)[0]
+
+def generate_swedish_phones(n):
+    """Generate n realistic Swedish phone numbers in one vectorized draw"""
+    if n <= 0:
+        return []
+    operators = _PHONE_RNG.integers(0, 10, size=n)
+    subscribers = _PHONE_RNG.integers(1000000, 10000000, size=n)
+    return [f"+467{operator}{subscriber}" for operator, subscriber in zip(operators.tolist(), subscribers.tolist())]
 
 def get_static_map_url(lat, lon, zoom=14, width=600, height=400, api_key=MAPTILER_API_KEY):
     """Generate a URL to a static map from MapTiler"""
@@ -0,0 +1,77 @@
+import os
+import orjson
+import requests
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Load environment variables
+load_dotenv()
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+
+CHAT_COMPLETIONS_URL = "https://api.openai.com/v1/chat/completions"
+SPEECH_URL = "https://api.openai.com/v1/audio/speech"
+
+def openai_retry(methods):
+    """Retry transient failures for the given HTTP methods with exponential backoff.
+    
+    Retry-After is honoured on 429/503, and once retries run out the last failed
+    response is returned as-is so callers still see its status code.
+    """
+    return Retry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=frozenset(methods),
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+
+def create_openai_session(pool_maxsize=16, retry_methods=("GET", "POST"), json_body=True):
+    """Create a requests session for the OpenAI API with pooled keep-alive connections and retries.
+    
+    Pass json_body=False to leave Content-Type to each request, e.g. for multipart file uploads.
+    """
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=pool_maxsize,
+        max_retries=openai_retry(retry_methods)
+    ))
+    session.headers["Authorization"] = f"Bearer {OPENAI_API_KEY}"
+    if json_body:
+        session.headers["Content-Type"] = "application/json"
+    return session
+
+def fetch_batch_answers(session, model, messages, prompts, timeout=None, **options):
+    """Answer several independent prompts with one JSON-mode chat completion, in order.
+    
+    messages are sent ahead of the combined prompt (system prompt, history). Raises
+    requests.RequestException on HTTP errors and ValueError if the reply cannot be split.
+    """
+    if not prompts:
+        return []
+    
+    numbered = "\n".join(f"{i + 1}. {prompt}" for i, prompt in enumerate(prompts))
+    batch_prompt = (
+        f"Answer each of the following {len(prompts)} questions separately. "
+        'Reply with a JSON object of the form {"answers": ["...", "..."]} '
+        "holding exactly one answer per question, in the same order.\n\n" + numbered
+    )
+    payload = dict(
+        options,
+        model=model,
+        messages=list(messages) + [{"role": "user", "content": batch_prompt}],
+        response_format={"type": "json_object"}
+    )
+    
+    response = session.post(CHAT_COMPLETIONS_URL, data=orjson.dumps(payload), timeout=timeout)
+    response.raise_for_status()
+    try:
+        content = orjson.loads(response.content)["choices"][0]["message"]["content"]
+        answers = orjson.loads(content)["answers"]
+    except (KeyError, IndexError, TypeError) as e:
+        raise ValueError(f"Malformed batched reply: {e!r}") from e
+    if not isinstance(answers, list) or len(answers) != len(prompts):
+        raise ValueError(f"Expected {len(prompts)} answers in the batched reply")
+    return [str(answer) for answer in answers]
@@ -1,128 +1,315 @@
 import streamlit as st
 import pandas as pd
+import logging
 import os
 import requests
-import json
-import base64
-from PIL import Image
-import io
-import time
+import orjson
 from datetime import datetime
-import tempfile
-import math
-import random
+import re
+from concurrent.futures import ThreadPoolExecutor, wait
 from dotenv import load_dotenv
+from cache import AUDIO_MIME_TYPES, AUDIO_SUFFIXES, TTS_FORMAT, tts_key, get_cached_audio, store_audio
+from openai_client import create_openai_session, fetch_batch_answers
 
 # Load environment variables
 load_dotenv()
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+
+# Log INFO and above by default; set the service loggers to DEBUG to see request details
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
 
 # Import specialized services
-from elks_service import make_reservation_call, make_connect_reservation_call, notify_user_via_call, send_reminder_sms
+from elks_service import E164, make_reservation_call, make_connect_reservation_call, notify_user_via_call, send_reminder_sms
 from maptiler_service import geocode_address, find_nearby_pharmacies, get_static_map_url, get_interactive_map_url
 
+@st.cache_resource(show_spinner=False)
+def get_openai_session():
+    """Create the OpenAI session once per process so keep-alive connections survive reruns"""
+    return create_openai_session(pool_maxsize=16)
+
+@st.cache_resource(show_spinner=False)
+def get_http_pool():
+    """Create the bounded worker pool for overlapping network calls (GPT, TTS, pharmacy lookup) once per process"""
+    return ThreadPoolExecutor(max_workers=8)
+
+@st.cache_resource(show_spinner=False)
+def get_prerender_pool():
+    """Create the small worker pool for speculative TTS pre-rendering once per process"""
+    # Kept apart from the interactive pool so a cold cache never queues ahead of users' replies
+    return ThreadPoolExecutor(max_workers=2)
+
+# This script's module body re-runs on every interaction, so the shared instances are looked up
+# here on the script thread; Streamlit's caches are unavailable from the worker threads that use them
+_OPENAI_SESSION = get_openai_session()
+_HTTP_POOL = get_http_pool()
+_PRERENDER_POOL = get_prerender_pool()
+
+# (connect, read) timeouts for OpenAI requests, instead of waiting indefinitely on a stalled call
+OPENAI_TIMEOUT = (3.05, 30)
+
+# Words in a query that trigger a nearby-pharmacy search (singular and plural forms)
+PHARMACY_RE = re.compile(
+    r"\b(?:pharmac(?:y|ies)|drugstores?|apotek(?:et)?|medications?|medicines?|prescriptions?)\b",
+    re.IGNORECASE
+)
+
+# Number of most recent assistant replies that keep their audio in session state
+AUDIO_HISTORY_LIMIT = 3
+
+# Chat model; gpt-4o-mini automatically reuses cached prompt prefixes across requests
+GPT_MODEL = "gpt-4o-mini"
+# Static system prompt, kept first and byte-identical across requests so it forms a cacheable prefix
+_SYSTEM_MSG = {
+    "role": "system",
+    "content": (
+        "You are a helpful healthcare assistant designed specifically for elderly users.\n"
+        "Your goal is to provide clear, simple, and accurate information about medications.\n"
+        "You should speak in a kind, patient manner and avoid using complex medical terminology.\n"
+        "If you're unsure about any medication details, acknowledge it and suggest consulting a healthcare professional.\n"
+        "Never provide medical advice that could be harmful.\n"
+        "Keep your responses brief and to the point, as they will be spoken out loud.\n"
+        "You are currently being used in Stockholm, Sweden."
+    )
+}
+
+# Questions behind the quick-option buttons; their answers are prefetched in one request
+PHARMACY_QUERY_TMPL = "Where can I find the nearest pharmacy near {address}?"
+COMMON_MEDICATIONS_QUERY = "What are some common medications for high blood pressure?"
+REMINDERS_QUERY = "How can I remember to take my medications on time?"
+
+# TTS settings; batch_service uses the same ones so pre-generated audio is found in the cache
+TTS_MODEL = "tts-1"
+TTS_VOICE = "nova"
+# OpenAI TTS rejects inputs longer than this many characters
+TTS_MAX_INPUT_CHARS = 4096
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+HELP_MESSAGE = """
+            This healthcare assistant helps you with:
+            
+            1. Information about medications
+            2. Finding nearby pharmacies in Stockholm
+            3. Setting up medication reservations and reminders
+            
+            Use the text area to type questions, or try the quick option buttons.
+            When you find a pharmacy you like, select it and use the reservation feature.
+            Check 'Connect me directly to the pharmacy' to speak with the pharmacy directly.
+            
+            If you don't hear any audio, click the page to enable voice.
+            """
+
 # TTS function
 def text_to_speech(text):
     """Convert text to speech using OpenAI's TTS API"""
+    parts = _split_for_tts(text)
+    if not parts:
+        return None
+    
+    # Only MP3 frames concatenate cleanly, so texts that need several requests are synthesized as mp3
+    response_format = TTS_FORMAT if len(parts) == 1 else "mp3"
+    suffix = AUDIO_SUFFIXES[response_format]
+    
+    # TTS output is deterministic for a given text and voice, so repeats are served from disk
+    key = tts_key(text, TTS_MODEL, TTS_VOICE, response_format)
+    cached_file = get_cached_audio(key, suffix=suffix)
+    if cached_file:
+        return cached_file
+    
     try:
-        headers = {
-            "Authorization": f"Bearer {OPENAI_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        
+        audio_file = store_audio(key, _stream_tts(parts, response_format), suffix=suffix)
+        logger.debug("Generated audio file: %s", audio_file)
+        return audio_file
+    except Exception as e:
+        logger.error("Text-to-speech exception: %s", e)
+        return None
+
+def _stream_tts(parts, response_format):
+    """Yield audio chunks for each text part as they arrive"""
+    for part in parts:
         payload = {
-            "model": "tts-1",
-            "input": text[:4096],
-            "voice": "nova",
-            "response_format": "mp3"
+            "model": TTS_MODEL,
+            "input": part,
+            "voice": TTS_VOICE,
+            "response_format": response_format
         }
         
-        response = requests.post(
+        with _OPENAI_SESSION.post(
             "https://api.openai.com/v1/audio/speech",
-            headers=headers,
-            json=payload
-        )
-        
-        if response.status_code == 200:
-            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".mp3")
-            temp_file.write(response.content)
-            temp_file.close()
-            print(f"Generated audio file: {temp_file.name}")
-            return temp_file.name
-        else:
-            print(f"Text-to-speech API error: {response.status_code} - {response.text}")
-            return None
-    except Exception as e:
-        print(f"Text-to-speech exception: {str(e)}")
-        return None
+            data=orjson.dumps(payload),
+            stream=True,
+            timeout=OPENAI_TIMEOUT
+        ) as response:
+            if response.status_code != 200:
+                raise RuntimeError(f"Text-to-speech API error: {response.status_code} - {response.text}")
+            yield from response.iter_content(chunk_size=4096)
+
+def speech_bytes(text):
+    """Synthesize text and return (audio bytes, MIME type), or (None, None) on failure"""
+    audio_file = text_to_speech(text)
+    if audio_file is None:
+        return None, None
+    try:
+        with open(audio_file, "rb") as f:
+            return f.read(), audio_mime(audio_file)
+    except OSError as e:
+        logger.error("Could not read audio file %s: %s", audio_file, e)
+        return None, None
+
+def audio_mime(audio_file):
+    """Return the MIME type st.audio needs for a synthesized audio file"""
+    return AUDIO_MIME_TYPES.get(os.path.splitext(audio_file)[1], "audio/mp3")
+
+def pregenerate_speech(texts):
+    """Synthesize canned messages into the TTS cache in the background"""
+    for text in texts:
+        _PRERENDER_POOL.submit(text_to_speech, text)
+
+def _split_for_tts(text, limit=TTS_MAX_INPUT_CHARS):
+    """Split text into pieces within the TTS input limit, breaking between sentences"""
+    parts = []
+    current = ""
+    for sentence in _SENTENCE_END.split(text.strip()):
+        # A single sentence longer than the limit is cut into limit-sized slices
+        for start in range(0, len(sentence), limit):
+            piece = sentence[start:start + limit]
+            if current and len(current) + 1 + len(piece) > limit:
+                parts.append(current)
+                current = piece
+            else:
+                current = f"{current} {piece}" if current else piece
+    if current:
+        parts.append(current)
+    return parts
 
 # GPT service function
-def get_gpt_response(user_input, conversation_history, medication_db=None):
-    """Get response from GPT-3.5 based on user input and conversation history"""
-    headers = {
-        "Authorization": f"Bearer {OPENAI_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    
-    # Prepare context from medication database if available
-    medication_context = ""
-    if medication_db is not None and not medication_db.empty:
-        medication_context = "Here is information about some medications from our database:\n"
-        for index, row in medication_db.iterrows():
-            medication_context += f"- {row['Medication']}: {row['Purpose']}, Dosage: {row['Dosage']}, Side Effects: {row['Side Effects']}\n"
+def get_gpt_response(user_input, conversation_history, medication_context=""):
+    """Get response from GPT based on user input, conversation history and medication context"""
+    # Add conversation history (limit to last 10 messages to save tokens); tuples keep the cache key hashable
+    history = tuple(
+        (message["role"], message["content"])
+        for message in conversation_history[-10:]
+        if "role" in message and "content" in message
+    )
     
+    try:
+        return _fetch_gpt_reply(history, medication_context)
+    except Exception as e:
+        logger.error("Exception in GPT response: %s", e)
+        return "I'm sorry, I encountered an error while processing your request. Please try again later."
+
+@st.cache_data(ttl=3600, max_entries=512, show_spinner=False)
+def _fetch_gpt_reply(history, medication_context):
+    """Request a chat reply, memoized per (history, context); failures raise so they are never cached"""
     # Prepare messages for API
-    messages = [
-        {
-            "role": "system",
-            "content": f"""You are a helpful healthcare assistant designed specifically for elderly users.
-            Your goal is to provide clear, simple, and accurate information about medications.
-            You should speak in a kind, patient manner and avoid using complex medical terminology.
-            If you're unsure about any medication details, acknowledge it and suggest consulting a healthcare professional.
-            Never provide medical advice that could be harmful.
-            Keep your responses brief and to the point, as they will be spoken out loud.
-            You are currently being used in Stockholm, Sweden.
-            
-            {medication_context}
-            """
-        }
-    ]
-    
-    # Add conversation history (limit to last 10 messages to save tokens)
-    for message in conversation_history[-10:]:
-        if "role" in message and "content" in message:
-            messages.append({
-                "role": message["role"],
-                "content": message["content"]
-            })
+    messages = _system_messages(medication_context)
+    messages.extend({"role": role, "content": content} for role, content in history)
     
     payload = {
-        "model": "gpt-3.5-turbo",
+        "model": GPT_MODEL,
         "messages": messages,
         "temperature": 0.7,
         "max_tokens": 300
     }
     
+    response = _OPENAI_SESSION.post(
+        "https://api.openai.com/v1/chat/completions",
+        data=orjson.dumps(payload),
+        timeout=OPENAI_TIMEOUT
+    )
+    
+    if response.status_code != 200:
+        raise RuntimeError(f"Error in GPT response: {response.status_code} - {response.text}")
+    result = orjson.loads(response.content)
+    return result["choices"][0]["message"]["content"]
+
+def get_quick_answers(queries, medication_context=""):
+    """Answer several quick-option questions with one JSON-mode chat completion, keyed by question"""
+    answers = fetch_batch_answers(
+        _OPENAI_SESSION,
+        GPT_MODEL,
+        _system_messages(medication_context),
+        queries,
+        timeout=OPENAI_TIMEOUT,
+        temperature=0.7,
+        max_tokens=300 * len(queries)
+    )
+    return dict(zip(queries, answers))
+
+def build_medication_context(medication_db):
+    """Describe the medication database for the system prompt"""
+    if medication_db is None or medication_db.empty:
+        return ""
+    # Format every row with vectorized string concatenation instead of iterrows()
+    lines = (
+        "- " + medication_db["Medication"]
+        + ": " + medication_db["Purpose"]
+        + ", Dosage: " + medication_db["Dosage"]
+        + ", Side Effects: " + medication_db["Side Effects"]
+    )
+    return "Here is information about some medications from our database:\n" + "\n".join(lines.tolist()) + "\n"
+
+def _system_messages(medication_context):
+    """Build the system messages: the static prompt first, then the session's medication context"""
+    messages = [_SYSTEM_MSG]
+    if medication_context:
+        messages.append({"role": "system", "content": medication_context})
+    return messages
+
+def ask_quick_option(query):
+    """Answer a quick-option question, preferring the answer prefetched at session start"""
+    st.session_state.conversation_history.append({"role": "user", "content": query})
+    
+    response = None
+    quick_answers = st.session_state.get("quick_answers")
+    if quick_answers is not None:
+        try:
+            response = quick_answers.result().get(query)
+        except Exception as e:
+            logger.warning("Quick-option prefetch failed: %s", e)
+    if response is None:
+        response = get_gpt_response(query, st.session_state.conversation_history, st.session_state.medication_context)
+    
+    add_assistant_message(response)
+    
+    st.rerun()
+
+def add_assistant_message(content):
+    """Show an assistant reply right away and synthesize its audio in the background"""
+    st.session_state.conversation_history.append({
+        "role": "assistant",
+        "content": content,
+        "audio_bytes": None,
+        "audio_format": None,
+        "audio_future": _HTTP_POOL.submit(speech_bytes, content) if st.session_state.voice_active else None
+    })
+
+def get_location(address):
+    """Return coordinates and map URLs for an address, memoized in session state until the address changes"""
+    location = st.session_state.get("location")
+    if location is None or location["address"] != address:
+        coordinates = geocode_address(address)
+        location = {
+            "address": address,
+            "coordinates": coordinates,
+            "map_url": get_static_map_url(coordinates[0], coordinates[1]) if coordinates else None,
+            "interactive_map_url": get_interactive_map_url(coordinates[0], coordinates[1]) if coordinates else None,
+            # Filled in by the first pharmacy search for this address
+            "pharmacies": None
+        }
+        st.session_state.location = location
+    return location
+
+def warm_openai_connection():
+    """Open the TLS connection to OpenAI ahead of the first real request"""
     try:
-        response = requests.post(
-            "https://api.openai.com/v1/chat/completions",
-            headers=headers,
-            json=payload
-        )
-        
-        if response.status_code == 200:
-            result = response.json()
-            return result["choices"][0]["message"]["content"]
-        else:
-            print(f"Error in GPT response: {response.status_code} - {response.text}")
-            return "I'm sorry, I encountered an error while processing your request. Please try again later."
-    except Exception as e:
-        print(f"Exception in GPT response: {str(e)}")
-        return "I'm sorry, I encountered an error while processing your request. Please try again later."
+        _OPENAI_SESSION.get("https://api.openai.com/v1/models", timeout=5).close()
+    except requests.RequestException as e:
+        logger.debug("OpenAI connection pre-warm failed: %s", e)
 
 # Create sample medication database
+@st.cache_resource(show_spinner=False)
 def create_sample_medication_database():
-    """Create a sample medication database"""
+    """Create a sample medication database, built once per process and shared read-only by all sessions"""
     data = {
         'Medication': [
             'Aspirin', 'Lisinopril', 'Metformin', 'Atorvastatin', 'Omeprazole',
@@ -150,19 +337,12 @@ def create_sample_medication_database():
         ]
     }
     
-    return pd.DataFrame(data)
+    # Arrow-backed strings are stored contiguously instead of as Python objects
+    return pd.DataFrame(data).astype({column: "string[pyarrow]" for column in data})
 
-# Main Streamlit application
-def main():
-    # Page configuration
-    st.set_page_config(
-        page_title="Voice Healthcare Assistant",
-        layout="wide",
-        initial_sidebar_state="expanded"
-    )
-    
-    # Custom CSS and JavaScript for senior-friendly interface and reliable autoplay
-    st.markdown("""
+# Custom CSS and JavaScript for senior-friendly interface and reliable autoplay.
+# Streamlit drops elements that a rerun does not emit again, so main() still renders this on every run.
+_STATIC_HEAD = """
     <style>
         body {
             background-color: #121212;
@@ -279,7 +459,7 @@ def main():
 
         function initAudioPlayback() {
             document.body.addEventListener('click', () => {
-                const silentAudio = new Audio('data:audio/mp3;base64,SUQzBAAAAAAAI1RTU0UAAAAPAAADTGF2ZjU4LjI5LjEwMAAAAAAAAAAAAAAA//tQwAAAAAAAAAAAAAAAAAAAAAAASW5mbwAAAA8AAAACAAABIADAwMDAwMDAwMDAwMDAwMDAwMDAwMDAwMDV1dXV1dXV1dXV1dXV1dXV1dXV1dXV1dXV6urq6urq6urq6urq6urq6urq6urq6urq6v////////////////////////////////8AAAAATGF2YzU4LjU0AAAAAAAAAAAAAAAAJAYAAAAAAAAAkCBTFDEAAAAAAAAAAAAAAAAAAP/7kMQAAAAAAAAAAAAAAAAAAAAAAFhpbmcAAAAPAAAAAwAAA1gAjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIAAAABMYXZjNTguMTAyAAAAAAAAAAAAAAAAEQAAAAAAAAAAAAAA//swxEsAAAGkAAAAwEAAAL/AAAA0gAAABFRFRUVFRERERERERERERESqqqqqqqqqqqqqqqqqqqqqqoAAAAAAKqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqg==');
+                const silentAudio = new Audio('app/static/silent.mp3');
                 silentAudio.play().then(() => {
                     console.log('Audio playback unlocked');
                     setInterval(autoPlayLatestAudio, 1000);
@@ -288,7 +468,7 @@ def main():
         }
 
         function testAudio() {
-            const testSound = new Audio('data:audio/mp3;base64,SUQzBAAAAAAAI1RTU0UAAAAPAAADTGF2ZjU4LjI5LjEwMAAAAAAAAAAAAAAA//tQwAAAAAAAAAAAAAAAAAAAAAAASW5mbwAAAA8AAAACAAABIADAwMDAwMDAwMDAwMDAwMDAwMDAwMDAwMDV1dXV1dXV1dXV1dXV1dXV1dXV1dXV1dXV6urq6urq6urq6urq6urq6urq6urq6urq6v////////////////////////////////8AAAAATGF2YzU4LjU0AAAAAAAAAAAAAAAAJAYAAAAAAAAAkCBTFDEAAAAAAAAAAAAAAAAAAP/7kMQAAAAAAAAAAAAAAAAAAAAAAFhpbmcAAAAPAAAAAwAAA1gAjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIAAAABMYXZjNTguMTAyAAAAAAAAAAAAAAAAEQAAAAAAAAAAAAAA//swxEsAAAGkAAAAwEAAAL/AAAA0gAAABFRFRUVFRERERERERERERESqqqqqqqqqqqqqqqqqqqqqqoAAAAAAKqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqg==');
+            const testSound = new Audio('app/static/silent.mp3');
             testSound.play().then(() => {
                 console.log('Test audio played');
                 document.getElementById('audio-status').innerHTML = 'Audio system working!';
@@ -305,13 +485,30 @@ def main():
         Please interact with the page to enable audio playback. <button onclick="testAudio()" class="test-audio-btn">Test Audio</button>
     </div>
     <div id="audio-status" style="margin-top: 5px;"></div>
-    """, unsafe_allow_html=True)
+    """
+
+# Main Streamlit application
+def main():
+    # Page configuration
+    st.set_page_config(
+        page_title="Voice Healthcare Assistant",
+        layout="wide",
+        initial_sidebar_state="expanded"
+    )
+    
+    # Custom CSS and JavaScript for senior-friendly interface and reliable autoplay
+    st.markdown(_STATIC_HEAD, unsafe_allow_html=True)
     
     # Initialize session state
     if "conversation_history" not in st.session_state:
         st.session_state.conversation_history = []
     if "medication_db" not in st.session_state:
         st.session_state.medication_db = create_sample_medication_database()
+    if "medication_context" not in st.session_state:
+        # Built once per session; rebuild it whenever medication_db is replaced
+        st.session_state.medication_context = build_medication_context(st.session_state.medication_db)
+    if "medication_names" not in st.session_state:
+        st.session_state.medication_names = st.session_state.medication_db["Medication"].tolist()
     if "user_profile" not in st.session_state:
         st.session_state.user_profile = {
             "name": "User",
@@ -330,8 +527,6 @@ def main():
         st.session_state.last_response = ""
     if "audio_file" not in st.session_state:
         st.session_state.audio_file = None
-    if "last_query" not in st.session_state:
-        st.session_state.last_query = ""
     if "session_started" not in st.session_state:
         st.session_state.session_started = False
     if "map_url" not in st.session_state:
@@ -369,27 +564,41 @@ def main():
     
     # Welcome message on first load
     if not st.session_state.session_started:
-        welcome_msg = f"Hello {st.session_state.user_profile['name']}! I'm your health assistant. How can I help you today?"
+        # Warm up the OpenAI connection in the background while the page renders
+        _HTTP_POOL.submit(warm_openai_connection)
         
-        if st.session_state.voice_active:
-            audio_file = text_to_speech(welcome_msg)
-        else:
-            audio_file = None
+        # Prefetch all quick-option answers with a single GPT call
+        if "quick_answers" not in st.session_state:
+            quick_queries = [
+                PHARMACY_QUERY_TMPL.format(address=st.session_state.user_profile["address"] or "Stockholm"),
+                COMMON_MEDICATIONS_QUERY,
+                REMINDERS_QUERY
+            ]
+            st.session_state.quick_answers = _HTTP_POOL.submit(
+                get_quick_answers,
+                quick_queries,
+                st.session_state.medication_context
+            )
+        
+        welcome_msg = f"Hello {st.session_state.user_profile['name']}! I'm your health assistant. How can I help you today?"
         
-        st.session_state.conversation_history.append({
-            "role": "assistant",
-            "content": welcome_msg,
-            "audio_file": audio_file
-        })
+        add_assistant_message(welcome_msg)
         
         st.session_state.last_response = welcome_msg
-        st.session_state.audio_file = audio_file
         st.session_state.session_started = True
         
-        # Find pharmacies at startup
-        pharmacies = find_nearby_pharmacies(st.session_state.user_profile["address"] or "Stockholm")
+        # Find pharmacies at startup, reusing an earlier search for the same address
+        location = get_location(st.session_state.user_profile["address"] or "Stockholm")
+        if location["pharmacies"] is None:
+            # Empty results are not memoized so the next search retries
+            location["pharmacies"] = find_nearby_pharmacies(location["address"]) or None
+        pharmacies = location["pharmacies"] or []
         if pharmacies:
             st.session_state.pharmacies = pharmacies
+        
+        # Pre-render canned replies so the help and pharmacy selection audio are cache hits
+        if st.session_state.voice_active:
+            pregenerate_speech([HELP_MESSAGE] + [f"Selected {pharmacy['name']}." for pharmacy in pharmacies])
     
     # Main content columns
     col1, col2 = st.columns([3, 1])
@@ -400,6 +609,10 @@ def main():
         # Display conversation history with audio
         conversation_container = st.container()
         with conversation_container:
+            # Only the latest replies keep their audio, which bounds session memory
+            assistant_indices = [i for i, message in enumerate(st.session_state.conversation_history) if message.get("role") == "assistant"]
+            keep_audio = set(assistant_indices[-AUDIO_HISTORY_LIMIT:])
+            
             for i, message in enumerate(st.session_state.conversation_history):
                 role = message.get("role", "")
                 content = message.get("content", "")
@@ -409,14 +622,19 @@ def main():
                 else:
                     st.markdown(f"<div class='assistant-message'><strong>Assistant:</strong> {content}</div>", unsafe_allow_html=True)
                     
-                    if st.session_state.voice_active and "audio_file" in message and message["audio_file"]:
-                        try:
-                            if os.path.exists(message["audio_file"]):
-                                st.audio(message["audio_file"], format="audio/mp3")
-                            else:
-                                st.warning(f"Audio file not found: {message['audio_file']}")
-                        except Exception as e:
-                            st.warning(f"Error playing audio: {str(e)}")
+                    # Pick up audio that finished synthesizing since the last run
+                    audio_future = message.get("audio_future")
+                    if audio_future is not None and audio_future.done():
+                        message["audio_bytes"], message["audio_format"] = audio_future.result()
+                        message["audio_future"] = None
+                    
+                    if i not in keep_audio:
+                        message.pop("audio_bytes", None)
+                        message["audio_future"] = None
+                    
+                    # Audio is served from memory, so reruns do not touch the disk
+                    if st.session_state.voice_active and message.get("audio_bytes"):
+                        st.audio(message["audio_bytes"], format=message["audio_format"])
         
         # Text input for queries
         user_input = st.text_area("Type your query about medications, health, or finding a pharmacy:", height=100)
@@ -426,36 +644,34 @@ def main():
                 with st.spinner("Processing your request..."):
                     st.session_state.conversation_history.append({"role": "user", "content": user_input})
                     
-                    response = get_gpt_response(user_input, st.session_state.conversation_history, st.session_state.medication_db)
+                    # Start the pharmacy lookup in the background so it overlaps with the GPT call;
+                    # results for an address already searched this session are reused
+                    pharmacies_future = None
+                    user_address = st.session_state.user_profile["address"] or "Stockholm"
+                    location = get_location(user_address)
+                    wants_pharmacies = PHARMACY_RE.search(user_input) is not None
+                    if wants_pharmacies and location["pharmacies"] is None:
+                        pharmacies_future = _HTTP_POOL.submit(find_nearby_pharmacies, user_address)
                     
-                    audio_file = text_to_speech(response) if st.session_state.voice_active else None
+                    response = get_gpt_response(user_input, st.session_state.conversation_history, st.session_state.medication_context)
+                    replies = [response]
                     
-                    st.session_state.conversation_history.append({
-                        "role": "assistant",
-                        "content": response,
-                        "audio_file": audio_file
-                    })
-                    
-                    if any(keyword in user_input.lower() for keyword in ["pharmacy", "drugstore", "apoteket", "apotek", "medication", "medicine", "prescription"]):
-                        user_address = st.session_state.user_profile["address"] or "Stockholm"
-                        
-                        pharmacies = find_nearby_pharmacies(user_address)
+                    if wants_pharmacies:
+                        if pharmacies_future is not None:
+                            location["pharmacies"] = pharmacies_future.result() or None
+                        pharmacies = location["pharmacies"]
                         if pharmacies:
                             st.session_state.pharmacies = pharmacies
                             
-                            coordinates = geocode_address(user_address)
-                            if coordinates:
-                                st.session_state.map_url = get_static_map_url(coordinates[0], coordinates[1])
+                            if location["map_url"]:
+                                st.session_state.map_url = location["map_url"]
                             
                             pharm_response = f"I found {len(pharmacies)} pharmacies near {user_address}. The closest is {pharmacies[0]['name']} which is {pharmacies[0]['distance']} km away."
-                            
-                            pharm_audio = text_to_speech(pharm_response) if st.session_state.voice_active else None
-                            
-                            st.session_state.conversation_history.append({
-                                "role": "assistant",
-                                "content": pharm_response,
-                                "audio_file": pharm_audio
-                            })
+                            replies.append(pharm_response)
+                    
+                    # Show the replies now; their audio is synthesized concurrently in the background
+                    for reply in replies:
+                        add_assistant_message(reply)
                     
                 st.rerun()
         
@@ -464,24 +680,15 @@ def main():
         
         with col_q1:
             if st.button("Find nearby pharmacies", use_container_width=True):
-                query = f"Where can I find the nearest pharmacy near {st.session_state.user_profile['address'] or 'Stockholm'}?"
-                st.session_state.conversation_history.append({"role": "user", "content": query})
-                st.session_state.last_query = query
-                st.rerun()
+                ask_quick_option(PHARMACY_QUERY_TMPL.format(address=st.session_state.user_profile["address"] or "Stockholm"))
                 
         with col_q2:
             if st.button("Common medications", use_container_width=True):
-                query = "What are some common medications for high blood pressure?"
-                st.session_state.conversation_history.append({"role": "user", "content": query})
-                st.session_state.last_query = query
-                st.rerun()
+                ask_quick_option(COMMON_MEDICATIONS_QUERY)
                 
         with col_q3:
             if st.button("Medication reminders", use_container_width=True):
-                query = "How can I remember to take my medications on time?"
-                st.session_state.conversation_history.append({"role": "user", "content": query})
-                st.session_state.last_query = query
-                st.rerun()
+                ask_quick_option(REMINDERS_QUERY)
     
     with col2:
         st.header("Pharmacy Finder")
@@ -490,11 +697,9 @@ def main():
         if st.session_state.map_url:
             st.image(st.session_state.map_url, use_column_width=True)
             
-            user_address = st.session_state.user_profile["address"] or "Stockholm"
-            coordinates = geocode_address(user_address)
-            if coordinates:
-                interactive_map_url = get_interactive_map_url(coordinates[0], coordinates[1])
-                st.markdown(f"[Open interactive map]({interactive_map_url})", unsafe_allow_html=True)
+            location = get_location(st.session_state.user_profile["address"] or "Stockholm")
+            if location["interactive_map_url"]:
+                st.markdown(f"[Open interactive map]({location['interactive_map_url']})", unsafe_allow_html=True)
         
         if st.session_state.pharmacies:
             st.subheader("Nearby Pharmacies")
@@ -518,25 +723,25 @@ def main():
                     if st.session_state.voice_active:
                         audio_file = text_to_speech(select_msg)
                         if audio_file:
-                            st.audio(audio_file, format="audio/mp3")
+                            st.audio(audio_file, format=audio_mime(audio_file))
         
         if st.session_state.current_pharmacy:
             st.subheader("Reserve Medication")
             st.write(f"Selected: {st.session_state.current_pharmacy['name']}")
             
-            medication_options = st.session_state.medication_db['Medication'].tolist()
-            medication_name = st.selectbox("Medication:", medication_options)
+            medication_name = st.selectbox("Medication:", st.session_state.medication_names)
             quantity = st.number_input("Quantity:", min_value=1, value=1)
             
             use_connect_call = st.checkbox("Connect me directly to the pharmacy", value=False)
             
             if st.button("Make Reservation Call", use_container_width=True):
                 if medication_name and st.session_state.user_profile["phone"]:
+                    user_phone = E164.from_raw(st.session_state.user_profile["phone"])
                     with st.spinner("Setting up reservation call..."):
                         if use_connect_call:
                             result = make_connect_reservation_call(
                                 st.session_state.user_profile["name"],
-                                st.session_state.user_profile["phone"],
+                                user_phone,
                                 st.session_state.current_pharmacy,
                                 medication_name,
                                 quantity
@@ -544,7 +749,7 @@ def main():
                         else:
                             result = make_reservation_call(
                                 st.session_state.user_profile["name"],
-                                st.session_state.user_profile["phone"],
+                                user_phone,
                                 st.session_state.current_pharmacy,
                                 medication_name,
                                 quantity
@@ -554,11 +759,12 @@ def main():
                             success_msg = f"Reservation call initiated for {quantity} {medication_name} at {st.session_state.current_pharmacy['name']}. {'You will be connected directly.' if use_connect_call else 'The pharmacy will receive a call to confirm your reservation.'}"
                             st.success(success_msg)
                             
-                            audio_file = text_to_speech(success_msg) if st.session_state.voice_active else None
+                            audio_bytes, audio_format = speech_bytes(success_msg) if st.session_state.voice_active else (None, None)
                             st.session_state.conversation_history.append({
                                 "role": "assistant",
                                 "content": success_msg,
-                                "audio_file": audio_file
+                                "audio_bytes": audio_bytes,
+                                "audio_format": audio_format
                             })
                             
                             st.session_state.reservation_history.append({
@@ -572,8 +778,8 @@ def main():
                                 "call_type": result.get("call_type", "ivr")
                             })
                             
-                            if audio_file:
-                                st.audio(audio_file, format="audio/mp3")
+                            if audio_bytes:
+                                st.audio(audio_bytes, format=audio_format)
                             
                             st.info("Waiting for pharmacy confirmation...")
                         else:
@@ -585,7 +791,7 @@ def main():
                 with st.spinner("Setting up medication reminder..."):
                     reminder_result = send_reminder_sms(
                         st.session_state.user_profile["name"],
-                        st.session_state.user_profile["phone"],
+                        E164.from_raw(st.session_state.user_profile["phone"]),
                         medication_name,
                         "now"
                     )
@@ -621,44 +827,16 @@ def main():
     
     with col_help:
         if st.button("❓ Help & Instructions", use_container_width=True):
-            help_msg = """
-            This healthcare assistant helps you with:
-            
-            1. Information about medications
-            2. Finding nearby pharmacies in Stockholm
-            3. Setting up medication reservations and reminders
-            
-            Use the text area to type questions, or try the quick option buttons.
-            When you find a pharmacy you like, select it and use the reservation feature.
-            Check 'Connect me directly to the pharmacy' to speak with the pharmacy directly.
-            
-            If you don't hear any audio, click the page to enable voice.
-            """
-            
-            st.session_state.conversation_history.append({
-                "role": "assistant",
-                "content": help_msg,
-                "audio_file": text_to_speech(help_msg) if st.session_state.voice_active else None
-            })
+            add_assistant_message(HELP_MESSAGE)
             
             st.rerun()
     
     st.markdown("<div class='footer'>Healthcare Assistant v2.1 | Voice-Enabled & Sweden-Ready</div>", unsafe_allow_html=True)
 
-    # Process last query if present
-    if st.session_state.last_query and st.session_state.last_query != "":
-        response = get_gpt_response(st.session_state.last_query, st.session_state.conversation_history, st.session_state.medication_db)
-        
-        audio_file = text_to_speech(response) if st.session_state.voice_active else None
-        
-        st.session_state.conversation_history.append({
-            "role": "assistant",
-            "content": response,
-            "audio_file": audio_file
-        })
-        
-        st.session_state.last_query = ""
-        
+    # Rerun once pending speech is ready so its audio player appears under the message
+    pending_audio = [message["audio_future"] for message in st.session_state.conversation_history if message.get("audio_future") is not None]
+    if pending_audio:
+        wait(pending_audio)
         st.rerun()
 
 if __name__ == "__main__":
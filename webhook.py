@@ -1,29 +1,174 @@
 from flask import Flask, request, Response
-import json
+import atexit
+import collections
+import logging
+import logging.handlers
+import orjson
 import os
+import queue
+import signal
+import threading
+import time
+from datetime import datetime
+from urllib.parse import parse_qsl
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Serve with `gunicorn webhook:app` (settings in gunicorn.conf.py). Importing this module opens the
+# log files and starts the logging threads, so each worker must import it rather than it being run directly.
 app = Flask(__name__)
 
+# Request threads only enqueue log records; a listener thread formats them and writes to stderr,
+# so a slow or blocked log pipe never holds up the webhook response
+logger = logging.getLogger(__name__)
+_log_queue = queue.SimpleQueue()
+_log_handler = logging.StreamHandler()
+_log_handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+_log_listener = logging.handlers.QueueListener(_log_queue, _log_handler)
+logger.addHandler(logging.handlers.QueueHandler(_log_queue))
+logger.setLevel(logging.INFO)
+logger.propagate = False
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
+# Log files stay open for the life of the process instead of being reopened on every request;
+# _LOG_LOCK keeps lines from concurrent requests intact. The call log has a 1 MB buffer, while
+# notifications are unbuffered because the writer thread already hands the OS a whole batch at once.
+_NOTIFICATIONS = open('notifications.txt', 'ab', buffering=0)
+_LOG_LOCK = threading.Lock()
+
+def _open_call_log_segment(hour):
+    """Open the call log segment for an hour (counted from the epoch), named by its UTC time"""
+    return open(time.strftime("call_log-%Y%m%d%H.json", time.gmtime(hour * 3600)), 'ab', buffering=1 << 20)
+
+# The call log is split into hourly append-only segments so no single file grows without bound;
+# plain O_APPEND segment files stay safe with several gunicorn workers, unlike rename-based rotation
+_call_log_hour = int(time.time()) // 3600
+_CALL_LOG = _open_call_log_segment(_call_log_hour)
+
+# Call log lines are NDJSON with sorted keys, so every callback shares one field layout for consumers
+_CALL_LOG_OPTIONS = orjson.OPT_APPEND_NEWLINE | orjson.OPT_SORT_KEYS
+
+def _flush_logs():
+    """Write queued and buffered log lines to disk"""
+    # Let the notification writer finish everything queued so far
+    _NOTIFY_QUEUE.join()
+    with _LOG_LOCK:
+        _CALL_LOG.flush()
+        _NOTIFICATIONS.flush()
+
+atexit.register(_flush_logs)
+
+_previous_sigterm = signal.getsignal(signal.SIGTERM)
+
+def _handle_sigterm(signum, frame):
+    """Flush buffered log lines, then hand SIGTERM on to the previous handler"""
+    # If this thread was interrupted mid-write the lock is held; atexit flushes once it is released
+    if _LOG_LOCK.acquire(blocking=False):
+        try:
+            _CALL_LOG.flush()
+            _NOTIFICATIONS.flush()
+        finally:
+            _LOG_LOCK.release()
+    if callable(_previous_sigterm):
+        _previous_sigterm(signum, frame)
+    elif _previous_sigterm != signal.SIG_IGN:
+        raise SystemExit(128 + signum)
+
+# Signal handlers can only be installed from the main thread
+if threading.current_thread() is threading.main_thread():
+    signal.signal(signal.SIGTERM, _handle_sigterm)
+
+# Fields of a 46elks call callback used by the handler; 'from' is a keyword, so its field is from_
+Event = collections.namedtuple('Event', 'id status callid direction from_ to')
+_EVENT_KEYS = ('id', 'status', 'callid', 'direction', 'from', 'to')
+
+# (second, formatted timestamp) for the most recent notification; replaced as one tuple so threads never see a torn pair
+_ts_cache = (0, b"")
+
+def _ts():
+    """Current local time as bytes at one-second resolution, formatted at most once per second"""
+    global _ts_cache
+    now = int(time.time())
+    cached_second, cached_text = _ts_cache
+    if now != cached_second:
+        cached_text = datetime.fromtimestamp(now).isoformat(sep=' ').encode()
+        _ts_cache = (now, cached_text)
+    return cached_text
+
+# Answered-call notifications are queued and written by a background thread, off the request path
+_NOTIFY_QUEUE = queue.Queue(maxsize=10_000)
+# Most queued notifications written with a single write call; stays below IOV_MAX (1024 on Linux)
+NOTIFY_BATCH_MAX = 256
+
+def _drain_notifications():
+    """Write queued notifications in batches, one gather write per batch"""
+    while True:
+        batch = [_NOTIFY_QUEUE.get()]
+        while len(batch) < NOTIFY_BATCH_MAX:
+            try:
+                batch.append(_NOTIFY_QUEUE.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            lines = [_notification_line(call_id, timestamp) for call_id, timestamp in batch]
+            with _LOG_LOCK:
+                _write_lines(_NOTIFICATIONS, lines)
+        except Exception as e:
+            logger.error("Failed to write %d notifications: %s", len(batch), e)
+        finally:
+            for _ in batch:
+                _NOTIFY_QUEUE.task_done()
+
+def _write_lines(f, lines):
+    """Append pre-serialized lines to an unbuffered file with one gather write where the OS supports it"""
+    if not hasattr(os, "writev"):
+        f.write(b"".join(lines))
+        return
+    written = os.writev(f.fileno(), lines)
+    if written < sum(map(len, lines)):
+        # Short write: append whatever the kernel did not take
+        f.write(b"".join(lines)[written:])
+
+def _notification_line(call_id, timestamp):
+    """Format one notification log line"""
+    return b"Notification triggered for call %b at %b\n" % (str(call_id).encode(), timestamp)
+
+threading.Thread(target=_drain_notifications, name="notification-writer", daemon=True).start()
+
+def _write_call_log(line):
+    """Append a line to the current call log segment, moving to a new segment when the hour changes"""
+    global _CALL_LOG, _call_log_hour
+    with _LOG_LOCK:
+        # Read the clock under the lock, and only ever move forward, so a request that waited on
+        # the lock across an hour boundary cannot reopen the previous segment
+        hour = int(time.time()) // 3600
+        if hour > _call_log_hour:
+            _CALL_LOG.close()
+            _CALL_LOG = _open_call_log_segment(hour)
+            _call_log_hour = hour
+        _CALL_LOG.write(line)
+
 @app.route('/webhook/46elks', methods=['POST'])
 def webhook():
-    data = request.form.to_dict()
-    with open('call_log.json', 'a') as f:
-        json.dump(data, f)
-        f.write('\n')
-    print(f"Webhook received: {data}")
+    # 46elks posts small urlencoded forms; decode the raw body directly instead of building a MultiDict
+    data = dict(parse_qsl(request.get_data(cache=False, as_text=True), keep_blank_values=True))
+    line = orjson.dumps(data, option=_CALL_LOG_OPTIONS)
+    _write_call_log(line)
+    logger.info("Webhook received: %s", data)
+    event = Event._make(map(data.get, _EVENT_KEYS))
     
     # Simulate notifying user when call is answered
-    if data.get('status') == 'answered':
-        print("Call answered, triggering user notification")
+    if event.status == 'answered':
+        logger.info("Call answered, triggering user notification")
         # In a real app, trigger notify_user_via_call here
         # For demo, log the event
-        with open('notifications.txt', 'a') as f:
-            f.write(f"Notification triggered for call {data.get('id')} at {datetime.now()}\n")
+        try:
+            _NOTIFY_QUEUE.put_nowait((event.id, _ts()))
+        except queue.Full:
+            # The writer has fallen behind; write this one inline rather than lose it
+            with _LOG_LOCK:
+                _NOTIFICATIONS.write(_notification_line(event.id, _ts()))
     
     return Response(status=200)
-
-if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000)
\ No newline at end of file